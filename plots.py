@@ -23,7 +23,7 @@ plt.rcParams.update(newparams)
 
 def plot_H_prob(qaoa, SP, C, savefig = None):
 
-    best_cost = np.max( qaoa.vector_cost(qaoa.state_strings) )
+    best_cost = np.max( qaoa._cost_table )
 
     fig, ax = plt.subplots(figsize  = (14,7))
 
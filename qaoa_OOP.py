@@ -125,6 +125,9 @@ class QAOABase:
         self.shots       = simulation_args.get('shots',  1)
         self.noise_model = simulation_args.get('noise_model',None)
 
+        # Additional options passed on to the backend with every job
+        self.run_config  = dict()
+
         # Give lower and upper limits (ll, ul) as arrays rather than
         # separately giving max and min for each variable, so that it is
         # easier to change the number of variables later on
@@ -261,7 +264,8 @@ class QAOAStandard(QAOABase):
             job = execute(circuit,
                           backend = self.backend,
                           noise_model = self.noise_model,
-                          shots = self.shots)
+                          shots = self.shots,
+                          **self.run_config)
         else:
             job = start_or_retrieve_job(name +"_"+str(g_it),
                                         self.backend,
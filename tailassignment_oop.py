@@ -1,45 +1,643 @@
 from qaoa_OOP import *
 
+from qiskit import QuantumRegister, QuantumCircuit
+from qiskit.circuit import Parameter, ParameterVector
+
+import os
+import functools
+import concurrent.futures
+import scipy.sparse
+
+try:
+    from numba import njit, prange
+except ImportError:
+    njit = None
+
+try:
+    import cupy
+except ImportError:
+    cupy = None
+
+def _popcount(x):
+    """
+    Number of set bits in each (nonnegative) integer of x, using SWAR bit tricks
+    """
+    x = x - ((x >> 1) & 0x5555555555555555)
+    x = (x & 0x3333333333333333) + ((x >> 2) & 0x3333333333333333)
+    x = (x + (x >> 4)) & 0x0F0F0F0F0F0F0F0F
+    x = x + (x >> 8)
+    x = x + (x >> 16)
+    x = x + (x >> 32)
+    return x & 0x7F
+
+if njit is not None:
+
+    _popcount_kernel = njit(_popcount)
+
+    # Fused kernels for tabulating the cost and is_solution over all 2^R basis states.
+    # The bits of each basis state are decoded on the fly, so the (2^R, R) state 
+    # matrix is never materialized.
+
+    # FR is passed as the CSC arrays data, indices, indptr, so that only
+    # the flights covered by each route are visited.
+
+    @njit(parallel = True, fastmath = True)
+    def _cost_table_kernel(data, indices, indptr, F, CR, mu, R):
+        table = np.empty(1 << R)
+
+        for i in prange(1 << R):
+            c = 0.0
+            s = np.zeros(F)
+            for k in range(R):
+                if (i >> k) & 1:
+                    c += CR[k]
+                    for j in range(indptr[k], indptr[k + 1]):
+                        s[indices[j]] += data[j]
+
+            table[i] = - (c + mu * np.sum((1.0 - s)**2))
+
+        return table
+
+    @njit(parallel = True)
+    def _sol_mask_kernel(data, indices, indptr, F, R):
+        mask = np.empty(1 << R, dtype = np.bool_)
+
+        for i in prange(1 << R):
+            s = np.zeros(F)
+            for k in range(R):
+                if (i >> k) & 1:
+                    for j in range(indptr[k], indptr[k + 1]):
+                        s[indices[j]] += data[j]
+
+            mask[i] = np.all(s == 1.0)
+
+        return mask
+
+    # Kernels for binary FR, where FR @ x for flight f is the popcount of the basis state 
+    # masked with the routes covering f
+
+    @njit(parallel = True)
+    def _cost_table_lut_kernel(masks, CR, mu, R):
+        table = np.empty(1 << R)
+
+        for i in prange(1 << R):
+            c = 0.0
+            for k in range(R):
+                if (i >> k) & 1:
+                    c += CR[k]
+
+            p = 0.0
+            for m in masks:
+                n  = 1 - _popcount_kernel(i & m)
+                p += n * n
+
+            table[i] = - (c + mu * p)
+
+        return table
+
+    @njit(parallel = True)
+    def _sol_mask_lut_kernel(masks, R):
+        mask = np.empty(1 << R, dtype = np.bool_)
+
+        for i in prange(1 << R):
+            sol = True
+            for m in masks:
+                if _popcount_kernel(i & m) != 1:
+                    sol = False
+                    break
+
+            mask[i] = sol
+
+        return mask
+
+    @njit(parallel = True, fastmath = True)
+    def _energy_kernel(h, pairs, J, R):
+        energy = np.empty(1 << R)
+
+        for i in prange(1 << R):
+            e = 0.0
+            for k in range(R):
+                e += h[k] * (1 - 2 * ((i >> k) & 1))
+            for p in range(J.size):
+                e += J[p] * (1 - 2 * ((i >> pairs[p,0]) & 1)) * (1 - 2 * ((i >> pairs[p,1]) & 1))
+
+            energy[i] = e
+
+        return energy
+
 class QAOATailAssignment(QAOAStandard):
 
     def __init__(self,options):
         number_of_qubits = options['CR'].size 
         super().__init__(number_of_qubits, options)
 
-        # Vectorized functions for the cost and is_solution:
-        # Very useful for simulation with the statevector, as it
-        # allows for avoiding multiple nested loops in the measurementStatistics function
+        # Save matrices as variables of object, see the properties FR, CR and mu:
         
-        self.vector_cost = np.vectorize(self.cost)
-        self.vector_is_solution = np.vectorize(self.is_solution)
+        self._FR        = self.options.get('FR', None)
+        self._CR        = self.options.get('CR', None)
+        self._mu        = self.options.get('mu', 1)
 
-        # Save matrices as variables of object:
-        
-        self.FR         = self.options.get('FR', None)
-        self.CR         = self.options.get('CR', None)
-        self.mu         = self.options.get('mu', 1)
+        # The statevector and the tables over all basis states can be kept in single precision, 
+        # halving their memory. The error is small compared to the shot noise and optimizer tolerances.
+
+        if self.options.get('single_precision', False):
+            self._real_dtype    = np.float32
+            self._complex_dtype = np.complex64
+        else:
+            self._real_dtype    = np.float64
+            self._complex_dtype = np.complex128
+
+        self._invalidate()
+
+    @property
+    def FR(self):
+        return self._FR
+
+    @FR.setter
+    def FR(self, FR):
+        self._FR = FR
+        self._invalidate()
+
+    @property
+    def CR(self):
+        return self._CR
+
+    @CR.setter
+    def CR(self, CR):
+        self._CR = CR
+        self._invalidate()
+
+    @property
+    def mu(self):
+        return self._mu
+
+    @mu.setter
+    def mu(self, mu):
+        self._mu = mu
+        self._invalidate()
+
+    def _invalidate(self):
+        """
+        Rebuilds everything derived from FR, CR and mu, i.e. the Ising coefficients,
+        the cover masks and sparse FR, and clears the cached circuits and the 
+        tables over all basis states. Called when FR, CR or mu is assigned; 
+        changing the arrays FR or CR in place is not detected.
+        The number of routes must stay the same, as it is the number of qubits.
+        """
 
         self.F, self.R  = np.shape(self.FR)
 
+        # If FR is binary, keep for each flight the bitmask of the routes covering it, 
+        # so that FR @ x for a basis state is a popcount per flight, see _cost_table
+
+        self._cover_masks = None
+
+        if np.all((self.FR == 0) | (self.FR == 1)) and self.R < 63:
+            self._cover_masks = np.sum(self.FR.astype(np.int64) << np.arange(self.R), axis = 1)
+
+        # Each flight is covered by few routes, so FR is stored as sparse matrices as well
+
+        self._FR_csr = scipy.sparse.csr_matrix(self.FR, dtype = np.float64)
+        self._FR_csc = self._FR_csr.tocsc()
+
+        # Ising coefficients of the full hamiltonian, used when applying U(gamma)
+
+        self._h      = 0.5 * self.CR + 0.5 * self.mu * (self._FR_csc.T @ (np.asarray(self._FR_csr.sum(axis = 1)).ravel() - 2))
+        self._J      = 0.5 * (self._FR_csc.T @ self._FR_csc).toarray()
+        self._h_cost = 0.5 * self.CR
+        self._h_exco = self._h - self._h_cost
+
+        # Routes that share no flights do not couple, so only the pairs r < r_ 
+        # with nonzero coupling need a CX-RZ-CX in the circuit
+
+        self._J_nz_pairs = [(int(r), int(r_), self._J[r,r_]) for r, r_ in np.argwhere(np.triu(self._J, 1) != 0)]
+
+        # Parameterized circuits for each depth, see _parameterized_circuit
+        self._param_circuits = dict()
+
+        # Tables over all basis states, built again on first access
+        for cls in type(self).__mro__:
+            for name, attr in vars(cls).items():
+                if isinstance(attr, functools.cached_property):
+                    self.__dict__.pop(name, None)
+
+    def generate_state_strings(self, qubits):
+        """
+        The basis states are indexed directly by integers in [0, 2^R), see 
+        _state_matrix, so the 2^R state strings are never generated.
+        """
+        self.state_strings = None
+
+    # The tables below depend only on FR, CR and mu, and are built on first access
+    # and reused for every depth. They are cleared by _invalidate when FR, CR or mu is assigned.
+    # Very useful for simulation with the statevector, as it
+    # allows for avoiding multiple nested loops in the measurementStatistics function
+
+    def _is_built(self, name):
+        """
+        Whether the cached table name has been built. Relies on 
+        functools.cached_property storing the value in the instance __dict__ 
+        under the same name on first access.
+        """
+        return name in self.__dict__
+
+    @functools.cached_property
+    def _state_matrix(self):
+        """
+        Decodes all 2^R basis states into the rows of the matrix X, where
+        X[i,r] = 1 if route r is used in basis state i.
+
+        Qiskit uses the ordering MSB ... LSB, so route r corresponds to
+        bit r of the basis state index i.
+
+        """
+
+        states = np.arange(2**self.R)
+        return ((states[:,None] >> np.arange(self.R)) & 1).astype(np.int8)
+
+    @functools.cached_property
+    def _cost_table(self):
+        """
+        Cost of every basis state, in the precision given by options['single_precision']
+        """
+        return self._build_cost_table().astype(self._real_dtype, copy = False)
+
+    def _build_cost_table(self):
+        if self.options.get('device', None) == 'cuda':
+            return self._build_cost_table_cuda()
+
+        if self._cover_masks is not None:
+
+            if njit is not None:
+                return _cost_table_lut_kernel(self._cover_masks,
+                                              np.ascontiguousarray(self.CR, dtype = np.float64),
+                                              float(self.mu), self.R)
+
+            states  = np.arange(2**self.R, dtype = np.int64)
+            penalty = np.zeros(2**self.R)
+
+            for m in self._cover_masks:
+                penalty += (1 - _popcount(states & m))**2
+
+            return - (self._route_costs() + self.mu * penalty)
+
+        if njit is not None:
+            FR = self._FR_csc
+            return _cost_table_kernel(FR.data, FR.indices, FR.indptr, self.F,
+                                      np.ascontiguousarray(self.CR, dtype = np.float64),
+                                      float(self.mu), self.R)
+
+        return self.batch_cost(self._state_matrix)
+
+    def _build_cost_table_cuda(self):
+        """
+        Cost of every basis state, computed on the GPU with CuPy if 
+        options['device'] is 'cuda', and copied back to the host once
+        """
+        if cupy is None:
+            raise ImportError("CuPy is required for options['device'] = 'cuda'")
+
+        if self._cover_masks is not None:
+
+            # CR @ x for every basis state, built by doubling on the device, see _route_costs
+            route_costs = cupy.zeros(1)
+
+            for r in range(self.R):
+                route_costs = cupy.concatenate((route_costs, route_costs + float(self.CR[r])))
+
+            states  = cupy.arange(2**self.R, dtype = cupy.int64)
+            penalty = cupy.zeros(2**self.R)
+
+            for m in self._cover_masks:
+                penalty += (1 - _popcount(states & int(m)))**2
+
+            table = - (route_costs + self.mu * penalty)
+
+        else:
+
+            # Decode the basis states in chunks, so that only a slice of the 
+            # state matrix X is on the device at a time
+
+            CR     = cupy.asarray(self.CR, dtype = cupy.float64)
+            FRT    = cupy.asarray(self.FR.T, dtype = cupy.float64)
+            shifts = cupy.arange(self.R, dtype = cupy.int64)
+            chunk  = min(2**self.R, 2**20)
+            table  = cupy.empty(2**self.R)
+
+            for start in range(0, 2**self.R, chunk):
+                states = cupy.arange(start, start + chunk, dtype = cupy.int64)
+                X      = ((states[:,None] >> shifts) & 1).astype(cupy.float64)
+
+                table[start:start + chunk] = - ( (X @ CR) + self.mu * cupy.sum((1 - (X @ FRT))**2, axis = 1) )
+
+        return cupy.asnumpy(table)
+
+    def _route_costs(self):
+        """
+        CR @ x for every basis state. Setting bit r of the basis states 
+        in [0, 2^r) adds CR[r], so the table is built by doubling. 
+        Not cached, as it is only needed while building _cost_table or _energy_cost.
+        """
+        route_costs = np.zeros(1)
+
+        for r in range(self.R):
+            route_costs = np.concatenate((route_costs, route_costs + self.CR[r]))
+
+        return route_costs
+
+    @functools.cached_property
+    def _sol_mask(self):
+        """
+        Whether every basis state is a solution
+        """
+        if self._cover_masks is not None:
+
+            if njit is not None:
+                return _sol_mask_lut_kernel(self._cover_masks, self.R)
+
+            states = np.arange(2**self.R, dtype = np.int64)
+            mask   = np.ones(2**self.R, dtype = bool)
+
+            for m in self._cover_masks:
+                mask &= _popcount(states & m) == 1
+
+            return mask
+
+        if njit is not None:
+            FR = self._FR_csc
+            return _sol_mask_kernel(FR.data, FR.indices, FR.indptr, self.F, self.R)
+
+        return np.all(self._state_matrix @ self.FR.T == 1, axis = 1)
+
+    @functools.cached_property
+    def _energy(self):
+        """
+        Ising energy sum_r h_r z_r + sum_{r < r_} J_rr_ z_r z_r_ of every basis state,
+        where z_r = 1 - 2 x_r. The hamiltonian part of a layer, U(gamma), is 
+        diagonal and equal to exp(-i gamma/2 * energy).
+        """
+        return self._build_energy().astype(self._real_dtype, copy = False)
+
+    def _build_energy(self):
+        if njit is not None:
+            pairs = np.array([(r, r_) for r, r_, _ in self._J_nz_pairs], dtype = np.int64).reshape(-1,2)
+            J     = np.array([Jrr_ for _, _, Jrr_ in self._J_nz_pairs], dtype = np.float64)
+
+            return _energy_kernel(np.ascontiguousarray(self._h, dtype = np.float64), pairs, J, self.R)
+
+        Z = 1 - 2 * self._state_matrix
+
+        return Z @ self._h + np.sum((Z @ np.triu(self._J, 1)) * Z, axis = 1)
+
+    @functools.cached_property
+    def _energy_cost(self):
+        """
+        Ising energy of the cost part, sum_r h_r z_r with h_r = CR[r]/2, of 
+        every basis state, corresponding to apply_cost
+        """
+        return (0.5 * np.sum(self.CR) - self._route_costs()).astype(self._real_dtype, copy = False)
+
+    @functools.cached_property
+    def _energy_exco(self):
+        """
+        Ising energy of the exact cover part of every basis state, corresponding 
+        to apply_exco. The energy is linear in h, so this is the remainder of _energy.
+        """
+        return self._energy - self._energy_cost
+
+    def _build_layer_template(self):
+        """
+        Builds a single layer U(beta)U(gamma) of the circuit with symbolic 
+        parameters gamma and beta, see _parameterized_circuit.
+
+        Returns
+        -------
+        qc : QuantumCircuit
+        gamma : Parameter
+        beta : Parameter
+        """
+
+        gamma = Parameter("gamma")
+        beta  = Parameter("beta")
+
+        q  = QuantumRegister(self.R)
+        qc = QuantumCircuit(q)
+
+        # Hamiltonian - cost + constraint
+        self.apply_hamiltonian(gamma, qc, q)
+
+        if self.options['usebarrier']:
+            qc.barrier()
+
+        # Apply mixer U(beta):
+        self.mix_states(beta, qc, q)
+        
+        if self.options['usebarrier']:
+            qc.barrier()
+
+        return qc, gamma, beta
+
+    @staticmethod
+    def _probs(statevector):
+        """
+        Probabilities of the basis states, |sv|^2 computed in a single pass 
+        without taking the square root in np.abs
+        """
+        sv = np.asarray(statevector)
+        return sv.real * sv.real + sv.imag * sv.imag
+
+    @staticmethod
+    def _apply_rx_all(psi, angle, R):
+        """
+        Applies rx(angle) to every qubit of the statevector psi in place, 
+        as a 2x2 rotation of the amplitude pairs differing in bit q only.
+        Replaces mix_states when simulating with the fast backend.
+        """
+        c = np.cos(angle / 2)
+        s = -1j * np.sin(angle / 2)
+
+        for q in range(R):
+            # View of psi, with the amplitudes with bit q = 0 and 1 along the middle axis
+            v  = psi.reshape(2**(R - q - 1), 2, 2**q)
+            v0 = v[:,0,:].copy()
+            v1 = v[:,1,:]
+
+            v[:,0,:] *= c
+            v[:,0,:] += s * v1
+            v1       *= c
+            v1       += s * v0
+
+        return psi
+
+    def _initial_statevector(self):
+        """
+        |+>^n as initial state for the fast backend, see initial_state
+        """
+        return np.full(2**self.R, 2**(- self.R / 2), dtype = self._complex_dtype)
+
+    def _simulate_statevector(self, params):
+        """
+        Simulates the circuit from createCircuit directly on the statevector, 
+        without going through qiskit. Used if options['fast_backend'] is True.
+
+        Each layer is a diagonal phase exp(-i gamma/2 * energy), see _energy,
+        followed by the mixer rx(-2 beta) on every qubit.
+
+        Parameters
+        ----------
+        params : array
+            variational parameters gamma_1 beta_1, ... , gamma_p beta_p
+
+        Returns
+        -------
+        psi : array
+            Statevector, in the same ordering as the qiskit statevector
+        """
+
+        gammas = params[::2]
+        betas  = params[1::2]
+
+        psi = self._initial_statevector()
+
+        for d in range(self.depth):
+
+            # Hamiltonian - cost + constraint
+            psi *= np.exp(-0.5j * gammas[d] * self._energy)
+
+            # Apply mixer U(beta):
+            self._apply_rx_all(psi, - 2 * betas[d], self.R)
+
+        return psi
+
+    def simulate_init(self, **simulation_args):
+
+        super().simulate_init(**simulation_args)
+
+        # Whether the backend gives the statevector rather than counts.
+        # The name is a method for BackendV1 and a property for BackendV2.
+        name = self.backend.name() if callable(self.backend.name) else self.backend.name
+
+        self._statevector_backend = "statevector" in name.split('_')
+
+        # The fast backend gives the exact, noiseless statevector, see _simulate_statevector
+        if self.options.get('fast_backend', False):
+            if self.noise_model is not None:
+                raise ValueError("options['fast_backend'] can not be combined with a noise model")
+            if not self._statevector_backend:
+                raise ValueError("options['fast_backend'] requires a statevector simulator as backend")
+
+        # Let the qiskit simulator use single precision as well, if it has the option.
+        # It is passed with each job, as the backend may be shared with other simulations.
+        backend_options = getattr(self.backend, 'options', None)
+
+        if self.options.get('single_precision', False) and hasattr(backend_options, 'precision'):
+            self.run_config['precision'] = "single"
+
+    def getval(self, params):
+        """
+        Objective function to use in the minimizer, see QAOAStandard.getval. 
+        If options['fast_backend'] is True, the circuit is simulated with
+        _simulate_statevector rather than executed on the backend.
+        """
+
+        if not self.options.get('fast_backend', False):
+            return super().getval(params)
+
+        self.g_it += 1
+
+        probs     = self._probs(self._simulate_statevector(params))
+        val, bval = self._statevector_statistics(probs)
+
+        self.g_values[str(self.g_it)]      = val
+        self.g_best_values[str(self.g_it)] = bval
+        self.g_params[str(self.g_it)]      = params
+
+        return -val
+
+    def basis_states(self, counts, base = 0):
+        """
+        Converts a dictionary of counts to an array of basis state indices, 
+        which index the tables above directly, and an array of the corresponding counts. 
+
+        Parameters
+        ----------
+        counts : dict
+            Counts with hex keys ('0x...') as in result.data.counts, or with 
+            binstrings as keys as in result.get_counts() if base = 2
+        base : int
+            Base of the keys, passed on to int
+
+        Returns
+        -------
+        states : array
+        counts_per_state : array
+        """
+
+        states           = np.fromiter((int(key, base) for key in counts.keys()), dtype = np.int64, count = len(counts))
+        counts_per_state = np.fromiter(counts.values(), dtype = np.float64, count = len(counts))
+
+        return states, counts_per_state
+
+    def batch_cost(self, X):
+        """
+        Cost of each row of the decoded matrix X, see _state_matrix
+        """
+        return - ( (X @ self.CR) + self.mu * np.sum((1 - (X @ self.FR.T))**2, axis = 1) )
+
+    def costs(self, states):
+        """
+        Cost of the given basis states, e.g. the measured ones. If the cost table 
+        is not built already, only the given states are decoded, as the number of 
+        measured states is typically much smaller than 2^R.
+        """
+        if self._is_built('_cost_table'):
+            return self._cost_table[states]
+
+        return self.batch_cost(((states[:,None] >> np.arange(self.R)) & 1).astype(np.int8))
+
+    def solutions(self, states):
+        """
+        Whether the given basis states are solutions, see costs
+        """
+        if self._is_built('_sol_mask'):
+            return self._sol_mask[states]
+
+        X = ((states[:,None] >> np.arange(self.R)) & 1).astype(np.int8)
+
+        return np.all(self._FR_csr @ X.T == 1, axis = 0)
+
+    @staticmethod
+    def _bits(binstring):
+        """
+        Decodes a binstring into an int8 array of its bits, reversing the 
+        string since qiskit uses ordering MSB ... LSB
+        """
+        return (np.frombuffer(binstring[::-1].encode('ascii'), dtype = np.uint8) - ord('0')).astype(np.int8)
 
     def cost(self,binstring):
         
-        # Reverse string since qiskit uses ordering MSB ... LSB
-        x = np.array(list(map(int,binstring[::-1])))
+        x = self._bits(binstring)
         return - ( (self.CR @ x) + self.mu * np.sum((1 - (self.FR @ x))**2) )
 
-    def mix_states(self,beta):
+    def mix_states(self, beta, qc = None, q = None):
         """
         Applies unitary evolution of mixer hamiltonian with 
         time parameter beta
 
         Parameters
         ----------
-        beta : float
+        beta : float or Parameter
             Time/angle for applying hamiltonian.
+        qc : QuantumCircuit or None
+            Circuit to apply the gates to, self.qc if None
+        q : QuantumRegister or None
+            Register of qc, self.q_register if None
 
         """
-        self.qc.rx( - 2 * beta, self.q_register ) 
+        if qc is None:
+            qc, q = self.qc, self.q_register
+
+        qc.rx( - 2 * beta, q ) 
 
     def apply_exco(self,gamma):
         """
@@ -53,19 +651,24 @@ class QAOATailAssignment(QAOAStandard):
 
         """
         
+        q  = self.q_register
+        rz = self.qc.rz
+        cx = self.qc.cx
+        h  = self._h_exco
+
         for r in range(self.R):
-            hr = 0.5 * self.mu * self.FR[:,r] @ (np.sum(self.FR,axis = 1) - 2)
+            hr = h[r]
 
-            self.qc.rz( gamma * hr, self.q_register[r])
+            if hr != 0:
+                rz( gamma * hr, q[r])
 
-            for r_ in range(r+1,self.R):
-                Jrr_  = 0.5 * self.FR[:,r] @ self.FR[:,r_]
+        for r, r_, Jrr_ in self._J_nz_pairs:
 
-                # Apply U(gamma), coupling part
+            # Apply U(gamma), coupling part
 
-                self.qc.cx(self.q_register[r], self.q_register[r_])
-                self.qc.rz(gamma * Jrr_, self.q_register[r_])
-                self.qc.cx(self.q_register[r], self.q_register[r_])
+            cx(q[r], q[r_])
+            rz(gamma * Jrr_, q[r_])
+            cx(q[r], q[r_])
 
     def apply_cost(self,gamma):
         """
@@ -79,36 +682,51 @@ class QAOATailAssignment(QAOAStandard):
 
         """
 
+        q  = self.q_register
+        rz = self.qc.rz
+        h  = self._h_cost
+
         for r in range(self.R):
-            hr = 0.5 * self.CR[r]
+            hr = h[r]
 
-            self.qc.rz(gamma * hr, self.q_register[r])
+            if hr != 0:
+                rz(gamma * hr, q[r])
 
-    def apply_hamiltonian(self,gamma):
+    def apply_hamiltonian(self, gamma, qc = None, q = None):
         """
         Applies unitary evolution of the full hamiltonian representing the 
         problem, with time parameter gamma
 
         Parameters
         ----------
-        gamma : float
+        gamma : float or Parameter
             Time/angle for applying hamiltonian.
+        qc : QuantumCircuit or None
+            Circuit to apply the gates to, self.qc if None
+        q : QuantumRegister or None
+            Register of qc, self.q_register if None
 
         """
-        
+        if qc is None:
+            qc, q = self.qc, self.q_register
+
+        rz = qc.rz
+        cx = qc.cx
+        h  = self._h
+
         for r in range(self.R):
-            hr = 0.5 * self.CR[r] + 0.5 * self.mu * self.FR[:,r] @ (np.sum(self.FR,axis = 1) - 2)
+            hr = h[r]
 
-            self.qc.rz( gamma * hr, self.q_register[r])
+            if hr != 0:
+                rz( gamma * hr, q[r])
 
-            for r_ in range(r+1,self.R):
-                Jrr_  = 0.5 * self.FR[:,r] @ self.FR[:,r_]
+        for r, r_, Jrr_ in self._J_nz_pairs:
 
-                # Apply U(gamma), coupling part
+            # Apply U(gamma), coupling part
 
-                self.qc.cx(self.q_register[r], self.q_register[r_])
-                self.qc.rz(gamma * Jrr_, self.q_register[r_])
-                self.qc.cx(self.q_register[r], self.q_register[r_])
+            cx(q[r], q[r_])
+            rz(gamma * Jrr_, q[r_])
+            cx(q[r], q[r_])
             
     def createCircuit(self, params):
 
@@ -125,38 +743,52 @@ class QAOATailAssignment(QAOAStandard):
 
         """
 
-        self.initial_state(self.R)
-        
-        gammas = params[::2]
-        betas  = params[1::2]
+        circuit, theta = self._parameterized_circuit()
 
-        for d in range(self.depth):
+        self.qc = circuit.assign_parameters(dict(zip(theta, params)))
 
-            gamma = gammas[d]
-            beta  = betas[d]
+        return self.qc
 
-            # Hamiltonian - cost + constraint
-            self.apply_hamiltonian(gamma)
-            # This is an equivalent implementation, but requires more gates.
-            # as the h-terms are not collected together
-            #self.apply_cost(gamma)
-            #self.apply_exco(gamma)
+    def _parameterized_circuit(self):
+        """
+        Circuit for the current depth with symbolic parameters
+        theta_1 ... theta_2p, corresponding to gamma_1 beta_1, ... , gamma_p beta_p.
+        The circuit is built once per depth from a single layer, see _build_layer_template, 
+        and reused for every optimizer iteration, so createCircuit only has to bind the parameters.
+
+        Returns
+        -------
+        qc : QuantumCircuit
+        theta : list
+            The parameters of qc, in the same order as params in createCircuit
+        """
 
-            if self.options['usebarrier']:
-                self.qc.barrier()
+        # Do not measure at the end of the circuit if using a
+        # statevector simulation 
+        measure = not self._statevector_backend
+        key     = (self.depth, measure, self.options['usebarrier'])
 
-            # Apply mixer U(beta):
-            self.mix_states(beta)
-            
-            if self.options['usebarrier']:
-                self.qc.barrier()
-                
-        if "statevector" not in self.backend.name().split('_'):
-            # Do not measure at the end of the circuit if using a
-            # statevector simulation 
-            self.qc.measure(self.q_register,self.c_register)
+        if key not in self._param_circuits:
 
-        return self.qc
+            layer_template, gamma, beta = self._build_layer_template()
+
+            theta = ParameterVector("theta", 2 * self.depth)
+
+            self.initial_state(self.R)
+
+            for d in range(self.depth):
+
+                layer = layer_template.assign_parameters({gamma : theta[2 * d],
+                                                          beta  : theta[2 * d + 1]})
+
+                self.qc.compose(layer, qubits = self.q_register, inplace = True)
+
+            if measure:
+                self.qc.measure(self.q_register,self.c_register)
+
+            self._param_circuits[key] = (self.qc, list(theta))
+
+        return self._param_circuits[key]
 
     def simulation_statistics(self, plot = True, savefig = None):
         """
@@ -184,28 +816,38 @@ class QAOATailAssignment(QAOAStandard):
         self.depth = 1
         while self.depth <= self.max_depth:
         
+            if self.options.get('fast_backend', False):
+
+                probs = self._probs(self._simulate_statevector(self.params[f'xL_d{self.depth}']))
+
+                SP[self.depth - 1] = self._sol_mask @ probs
+                C[self.depth - 1]  = self._cost_table @ probs
+
+                self.depth += 1
+                continue
+
             qc  = self.createCircuit(self.params[f'xL_d{self.depth}'])
             job = execute(qc,
                           backend = self.backend,
                           noise_model = self.noise_model,
-                          shots = self.shots)
+                          shots = self.shots,
+                          **self.run_config)
             
             SP[self.depth - 1] = self.successProbability(job)
 
-            if "statevector" in self.backend.name().split('_'):
+            if self._statevector_backend:
                 
                 statevector = job.result().get_statevector()
-                probs = (np.abs(statevector))**2
+                probs = self._probs(statevector)
                 
-                C[self.depth - 1 ] = self.vector_cost(self.state_strings) @ probs
+                C[self.depth - 1 ] = self._cost_table @ probs
 
             else:
 
-                counts            = job.result().get_counts()
-                binstrings        = np.array(list(counts.keys()))
-                counts_per_string = np.array(list(counts.values()))
+                counts                   = job.result().get_counts()
+                states, counts_per_state = self.basis_states(counts, base = 2)
                 
-                C[self.depth - 1] = self.vector_cost(binstrings) @ counts_per_string / self.shots
+                C[self.depth - 1] = self.costs(states) @ counts_per_state / self.shots
 
             self.depth += 1
         if plot:
@@ -214,8 +856,9 @@ class QAOATailAssignment(QAOAStandard):
         return SP, C
 
     def is_solution(self,binstring):
-        a = np.array(list(map(int,binstring[::-1])))
-        return np.all(np.sum(self.FR * a,1)-1 == 0)
+        # Only used for single binstrings, the tables use _sol_mask
+        a = self._bits(binstring)
+        return bool(np.all(self._FR_csr @ a == 1))
 
     def successProbability(self,job):
         """
@@ -234,13 +877,13 @@ class QAOATailAssignment(QAOAStandard):
         """
         
         
-        if "statevector" in self.backend.name().split('_'):
+        if self._statevector_backend:
             
             experiment_results = job.result().results
             statevector = job.result().get_statevector()
-            probs = (np.abs(statevector))**2
+            probs = self._probs(statevector)
 
-            s_prob = self.vector_is_solution(self.state_strings) @ probs
+            s_prob = self._sol_mask @ probs
             
         else:
             
@@ -250,12 +893,9 @@ class QAOATailAssignment(QAOAStandard):
 
             for result in experiment_results:
                 n_shots = result.shots
-                counts = result.data.counts
-                for hexkey in list(counts.keys()):
-                    count = counts[hexkey]
-                    binstring = "{0:b}".format(int(hexkey,0)).zfill(rN)
-                    if is_Solution(binstring, FR):
-                        s_prob += count/n_shots
+                states, counts_per_state = self.basis_states(result.data.counts)
+
+                s_prob += self.solutions(states) @ counts_per_state / n_shots
             
         return s_prob
 
@@ -277,7 +917,6 @@ class QAOATailAssignment(QAOAStandard):
 
         """
 
-        R         = np.size(self.FR[0,:])
         cost_best = - np.inf
         experiment_results = job.result().results
         expectations = np.zeros(len(experiment_results))
@@ -287,16 +926,13 @@ class QAOATailAssignment(QAOAStandard):
         ## as many operations are  vectorized here and don't depend on iterating through
         ## dictionaries
         
-        if "statevector" in self.backend.name().split('_'):
+        if self._statevector_backend:
 
             statevector = job.result().get_statevector()
-            probs = np.abs(statevector)**2
-
-            costs = self.vector_cost(self.state_strings)
-            E     = costs @ probs
+            probs = self._probs(statevector)
 
-            best_sampled_state = np.max( costs @ np.ceil(probs))
-            cost_best          = max(cost_best,best_sampled_state)
+            E, best_sampled_state = self._statevector_statistics(probs)
+            cost_best             = max(cost_best,best_sampled_state)
 
             expectations[0] = E 
 
@@ -304,27 +940,85 @@ class QAOATailAssignment(QAOAStandard):
         
         else:
             
-           for i, result in enumerate(experiment_results):
-               n_shots = result.shots
-               counts = result.data.counts
-
-               E  = 0
-
-               for hexkey in list(counts.keys()):
-                   count     = counts[hexkey]
-                   binstring = "{0:b}".format(int(hexkey,0)).zfill(R)
-                   cost      = self.cost(binstring)
-                   cost_best = max(cost_best, cost)
-                   E        += cost*count/n_shots
-
+           # The experiments are independent. A single circuit is executed in getval, so 
+           # only start a thread pool if the job contains several experiments.
+           if len(experiment_results) > 1:
+               with concurrent.futures.ThreadPoolExecutor(max_workers = os.cpu_count()) as executor:
+                   statistics = list(executor.map(self._expectation_for_result, experiment_results))
+           else:
+               statistics = [self._expectation_for_result(result) for result in experiment_results]
+
+           for i, (E, best_sampled_state) in enumerate(statistics):
+               cost_best       = max(cost_best, best_sampled_state)
                expectations[i] = E
                
 
         return expectations, None , cost_best
 
+    def _expectation_for_result(self, result):
+        """
+        Expectation value and best measured cost for a single experiment result
+        """
+
+        n_shots = result.shots
+        states, counts_per_state = self.basis_states(result.data.counts)
+
+        costs = self.costs(states)
+        E     = costs @ counts_per_state / n_shots
+
+        return E, np.max(costs)
+
+    def _statevector_statistics(self, probs):
+        """
+        Expectation value and best cost among the states with nonzero 
+        probability, from the probabilities of all basis states
+        """
+
+        costs = self._cost_table
+        probs = probs.astype(costs.dtype, copy = False)
+        E     = costs @ probs
+
+        return E, np.max( costs[probs > 0] )
+
 
 class TailAssignmentInterlaced(QAOATailAssignment):
 
+    def _simulate_statevector(self, params):
+        """
+        Simulates the circuit from createCircuit directly on the statevector, 
+        see QAOATailAssignment._simulate_statevector
+
+        Parameters
+        ----------
+        params : array
+            variational parameters gamma_1 beta_1 delta_1 , ... , gamma_p beta_p delta_p
+
+        Returns
+        -------
+        psi : array
+        """
+
+        gammas = params[::3]
+        betas  = params[1::3]
+        deltas = params[2::3]
+
+        psi = self._initial_statevector()
+
+        for d in range(self.depth):
+
+            # Hamiltonian - weights 
+            psi *= np.exp(-0.5j * deltas[d] * self._energy_cost)
+
+            # Apply mixer U(beta) inbetween hamiltonians
+            self._apply_rx_all(psi, - 2 * betas[d], self.R)
+
+            psi *= np.exp(-0.5j * gammas[d] * self._energy_exco)
+
+            # Apply mixer U(beta) at the end
+            self._apply_rx_all(psi, - 2 * betas[d], self.R)
+
+        return psi
+
     def createCircuit(self, params):
 
         """
@@ -346,6 +1040,9 @@ class TailAssignmentInterlaced(QAOATailAssignment):
         betas  = params[1::3]
         deltas = params[2::3]
 
+        usebarrier = self.options['usebarrier']
+        barrier    = self.qc.barrier
+
         for d in range(self.depth):
 
             gamma = gammas[d]
@@ -355,24 +1052,24 @@ class TailAssignmentInterlaced(QAOATailAssignment):
             # Hamiltonian - weights 
             self.apply_cost(delta)
 
-            if self.options['usebarrier']:
-                self.qc.barrier()
+            if usebarrier:
+                barrier()
 
              # Apply mixer U(beta) inbetween hamiltonians
             self.mix_states(beta)
 
-            if self.options['usebarrier']:
-                self.qc.barrier()
+            if usebarrier:
+                barrier()
 
             self.apply_exco(gamma)
 
             # Apply mixer U(beta) at the end
             self.mix_states(beta)
             
-            if self.options['usebarrier']:
-                self.qc.barrier()
+            if usebarrier:
+                barrier()
                 
-        if "statevector" not in self.backend.name().split('_'):
+        if not self._statevector_backend:
             # Do not measure at the end of the circuit if using a
             # statevector simulation 
             self.qc.measure(self.q_register,self.c_register)
@@ -0,0 +1,212 @@
+import unittest
+from unittest import mock
+import tailassignment_oop
+from tailassignment_oop import *
+import numpy as np
+from qiskit import *
+from qiskit import BasicAer
+
+class TestTailAssignment(unittest.TestCase):
+
+    def setUp(self):
+        ### exact cover instance with the solutions '0110', '0001', '1001' and '1110', see exactcover_unittests.py
+        self.FR = np.zeros((2,4))
+        self.FR[0,1]=1
+        self.FR[1,2]=1
+        self.FR[0,3]=1
+        self.FR[1,3]=1
+
+        self.CR = np.array([0.5, 0.2, 0.7, 1.0])
+
+    def get_options(self, FR, **options):
+        options['FR'] = FR
+        options['CR'] = self.CR
+        options['mu'] = 1.5
+        options.setdefault('usebarrier', False)
+        return options
+
+    def get_simulation_args(self, backend, **simulation_args):
+        simulation_args['backend']   = backend
+        simulation_args['optmethod'] = 'Nelder-Mead'
+        simulation_args['max_depth'] = 2
+        simulation_args['params_ll'] = np.array([0,0])
+        simulation_args['params_ul'] = np.array([2 * np.pi, np.pi])
+        simulation_args['params_n']  = np.array([4, 4])
+        return simulation_args
+
+    def assertTablesMatch(self, FR):
+        qaoa = QAOATailAssignment(self.get_options(FR))
+        R    = qaoa.R
+
+        for i in range(2**R):
+            ### qiskit order of the bit strings is $q_n q_{n-1} .... q_0$, so state i is the binary representation of i
+            binstring = "{0:b}".format(i).zfill(R)
+            self.assertAlmostEqual(qaoa._cost_table[i], qaoa.cost(binstring))
+            self.assertEqual(qaoa._sol_mask[i], qaoa.is_solution(binstring))
+
+        states = np.arange(2**R)
+        np.testing.assert_allclose(qaoa.costs(states), qaoa._cost_table)
+
+    def test_tables(self):
+        self.assertTablesMatch(self.FR)
+
+        ### FR with an entry that is not 0 or 1 uses the general path
+        FR = self.FR.copy()
+        FR[0,2] = 2
+        self.assertTablesMatch(FR)
+
+    @unittest.skipIf(tailassignment_oop.njit is None, "numba is not installed")
+    def test_tables_without_numba(self):
+        with mock.patch.object(tailassignment_oop, 'njit', None):
+            self.test_tables()
+
+    def test_costs_without_tables(self):
+        ### a fresh instance decodes only the given states rather than building the tables
+        qaoa       = QAOATailAssignment(self.get_options(self.FR))
+        states     = np.array([0, 5, 6, 9, 14])
+        binstrings = ["{0:b}".format(i).zfill(qaoa.R) for i in states]
+
+        np.testing.assert_allclose(qaoa.costs(states), [qaoa.cost(b) for b in binstrings])
+        np.testing.assert_array_equal(qaoa.solutions(states), [qaoa.is_solution(b) for b in binstrings])
+
+        self.assertFalse(qaoa._is_built('_cost_table'))
+        self.assertFalse(qaoa._is_built('_sol_mask'))
+
+    def test_invalidate(self):
+        backend    = BasicAer.get_backend('statevector_simulator')
+        params     = np.array([0.3, 1.1])
+        qaoa       = QAOATailAssignment(self.get_options(self.FR))
+        qaoa.simulate_init(**self.get_simulation_args(backend))
+        qaoa.depth = 1
+
+        cost_table = qaoa._cost_table.copy()
+        qaoa.createCircuit(params)
+
+        ### assigning mu rebuilds everything derived from it
+        qaoa.mu = 3
+
+        options       = self.get_options(self.FR)
+        options['mu'] = 3
+        fresh         = QAOATailAssignment(options)
+        fresh.simulate_init(**self.get_simulation_args(backend))
+        fresh.depth   = 1
+
+        sv       = execute(qaoa.createCircuit(params), backend = backend).result().get_statevector()
+        sv_fresh = execute(fresh.createCircuit(params), backend = backend).result().get_statevector()
+        self.assertAlmostEqual(abs(np.vdot(sv, sv_fresh)), 1)
+
+        self.assertFalse(np.allclose(qaoa._cost_table, cost_table))
+        for i in range(2**qaoa.R):
+            binstring = "{0:b}".format(i).zfill(qaoa.R)
+            self.assertAlmostEqual(qaoa._cost_table[i], qaoa.cost(binstring))
+        np.testing.assert_allclose(qaoa._h, fresh._h)
+        np.testing.assert_allclose(qaoa._cost_table, fresh._cost_table)
+
+    def test_is_solution(self):
+        qaoa = QAOATailAssignment(self.get_options(self.FR))
+
+        ## solutions
+        for binstring in ['0110', '0001', '1001', '1110']:
+            self.assertEqual(qaoa.is_solution(binstring[::-1]), True)
+            self.assertEqual(qaoa._sol_mask[int(binstring[::-1], 2)], True)
+
+        ## not solutions
+        for binstring in ['0000', '0010', '0011', '0101', '1111']:
+            self.assertEqual(qaoa.is_solution(binstring[::-1]), False)
+
+    def assertStatevectorMatches(self, qaoa_class, params, depth):
+        backend = BasicAer.get_backend('statevector_simulator')
+        qaoa    = qaoa_class(self.get_options(self.FR, usebarrier = True))
+
+        qaoa.simulate_init(**self.get_simulation_args(backend))
+        qaoa.depth = depth
+
+        job = execute(qaoa.createCircuit(params), backend = backend, **qaoa.run_config)
+        sv  = np.asarray(job.result().get_statevector())
+        psi = qaoa._simulate_statevector(params)
+
+        ### equal up to a global phase
+        self.assertAlmostEqual(abs(np.vdot(sv, psi)), 1)
+
+    def test_simulate_statevector(self):
+        self.assertStatevectorMatches(QAOATailAssignment, np.array([0.3, 1.1, 2.5, 0.4]), 2)
+        self.assertStatevectorMatches(TailAssignmentInterlaced, np.array([0.3, 1.1, 0.8, 2.5, 0.4, 1.9]), 2)
+
+    def test_statevector_cost_best(self):
+        backend = BasicAer.get_backend('statevector_simulator')
+        qaoa    = QAOATailAssignment(self.get_options(self.FR))
+        qaoa.simulate_init(**self.get_simulation_args(backend))
+        qaoa.depth = 2
+
+        job   = execute(qaoa.createCircuit(np.array([0.3, 1.1, 2.5, 0.4])), backend = backend)
+        probs = qaoa._probs(job.result().get_statevector())
+
+        ### best cost among the states with nonzero probability, not the sum of their costs
+        self.assertEqual(qaoa.measurementStatistics(job)[2], np.max(qaoa._cost_table[probs > 0]))
+
+    def test_basis_states(self):
+        qaoa = QAOATailAssignment(self.get_options(self.FR))
+
+        ### hex keys as in result.data.counts
+        states, counts_per_state = qaoa.basis_states({'0x0' : 3, '0x5' : 2, '0xe' : 1})
+        np.testing.assert_array_equal(states, [0, 5, 14])
+        np.testing.assert_array_equal(counts_per_state, [3, 2, 1])
+
+        ### binstrings as in result.get_counts(), qiskit order $q_n q_{n-1} .... q_0$
+        states, counts_per_state = qaoa.basis_states({'0000' : 3, '0101' : 2, '1110' : 1}, base = 2)
+        np.testing.assert_array_equal(states, [0, 5, 14])
+        np.testing.assert_array_equal(counts_per_state, [3, 2, 1])
+
+    def test_shots(self):
+        params = np.array([0.3, 1.1, 2.5, 0.4])
+        shots  = 8192
+
+        ### exact values from the statevector
+        qaoa_sv = QAOATailAssignment(self.get_options(self.FR))
+        qaoa_sv.simulate_init(**self.get_simulation_args(BasicAer.get_backend('statevector_simulator')))
+        qaoa_sv.depth = 2
+
+        job_sv = execute(qaoa_sv.createCircuit(params), backend = qaoa_sv.backend)
+        probs  = qaoa_sv._probs(job_sv.result().get_statevector())
+
+        s_prob = qaoa_sv.successProbability(job_sv)
+        E      = qaoa_sv.measurementStatistics(job_sv)[0][0]
+        var_E  = (qaoa_sv._cost_table**2) @ probs - E**2
+
+        ### sampled values
+        backend = BasicAer.get_backend('qasm_simulator')
+        qaoa    = QAOATailAssignment(self.get_options(self.FR))
+        qaoa.simulate_init(**self.get_simulation_args(backend, shots = shots))
+        qaoa.depth = 2
+
+        job = execute(qaoa.createCircuit(params), backend = backend, shots = shots, seed_simulator = 42)
+
+        ### within 5 standard deviations of the shot noise
+        self.assertLess(abs(qaoa.successProbability(job) - s_prob), 5 * np.sqrt(s_prob * (1 - s_prob) / shots))
+
+        expectations, _, cost_best = qaoa.measurementStatistics(job)
+        self.assertLess(abs(expectations[0] - E), 5 * np.sqrt(var_E / shots))
+
+        ### the hex keys of the result and the binstrings of get_counts decode to the same states
+        counts = job.result().get_counts()
+        hex_states, hex_counts = qaoa.basis_states(job.result().results[0].data.counts)
+        bin_states, bin_counts = qaoa.basis_states(counts, base = 2)
+
+        self.assertEqual(dict(zip(hex_states, hex_counts)), dict(zip(bin_states, bin_counts)))
+        self.assertEqual(cost_best, max(qaoa.cost(binstring) for binstring in counts))
+
+        for state, binstring in zip(bin_states, counts):
+            self.assertAlmostEqual(qaoa.costs(np.array([state]))[0], qaoa.cost(binstring))
+
+    def test_fast_backend_requires_exact_statevector(self):
+        qaoa = QAOATailAssignment(self.get_options(self.FR, fast_backend = True))
+
+        with self.assertRaises(ValueError):
+            qaoa.simulate_init(**self.get_simulation_args(BasicAer.get_backend('qasm_simulator')))
+
+        with self.assertRaises(ValueError):
+            qaoa.simulate_init(**self.get_simulation_args(BasicAer.get_backend('statevector_simulator'),
+                                                          noise_model = object()))
+
+if __name__ == '__main__':
+    unittest.main()